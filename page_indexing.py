@@ -6,26 +6,37 @@ What it does:
 - Prompts you in the terminal to choose/paste a GSC property (siteUrl)
 - Reads a list of URLs from a text file (one URL per line)
 - Uses the Search Console URL Inspection API to fetch indexing status per URL
+  (several URLs in flight at once, paced and retried with backoff)
 - Saves results into: ./results/YYYY-MM-DD/index_status.csv
+- Caches inspection results for a day in .gsc_cache (delete it to force a refresh)
 
 Prereqs:
 - Enable "Google Search Console API" in Google Cloud for your project
 - OAuth Client ID: "Desktop app" -> download as client_secret.json into this folder
 - Install deps:
-    pip install google-api-python-client google-auth google-auth-oauthlib google-auth-httplib2
+    pip install "google-api-python-client>=2.0" google-auth google-auth-oauthlib google-auth-httplib2
 """
 
 from __future__ import annotations
 
 import csv
+import hashlib
+import json
 import os
+import random
+import shelve
 import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date
-from typing import Dict, List, Optional
+from itertools import repeat
+from typing import Dict, List, Optional, Tuple
 
+from google_auth_httplib2 import AuthorizedHttp
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.http import build_http
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
@@ -33,45 +44,82 @@ from google.auth.transport.requests import Request
 SCOPES = ["https://www.googleapis.com/auth/webmasters.readonly"]
 CLIENT_SECRET_FILE = "client_secret.json"
 TOKEN_FILE = "token.json"
+CSV_BUFFER_SIZE = 1 << 20  # write the CSV in 1 MiB blocks instead of 8 KiB
+# Partial response: skip mobile usability / AMP / rich results we never read.
+RESPONSE_FIELDS = "inspectionResult/indexStatusResult"
+# indexStatusResult fields, in CSV column order (verdict .. canonical_user)
+INDEX_STATUS_KEYS = (
+    "verdict",
+    "coverageState",
+    "indexingState",
+    "robotsTxtState",
+    "pageFetchState",
+    "crawledAs",
+    "lastCrawlTime",
+    "googleCanonical",
+    "userCanonical",
+)
+CACHE_FILE = ".gsc_cache"
+CACHE_TTL_SECONDS = 24 * 60 * 60
+SITES_CACHE_TTL_SECONDS = 60 * 60
+
+# URL Inspection API quota is 600 requests/minute per property.
+# Lower this if you share the quota with other tools.
+INSPECTION_QUOTA_PER_MINUTE = 600
+# The token bucket starts full, so the refill rate leaves room for that
+# burst: any 60 s window sends at most BURST + (quota - BURST) = quota.
+BURST_REQUESTS = 10
+MAX_REQUESTS_PER_MINUTE = INSPECTION_QUOTA_PER_MINUTE - BURST_REQUESTS
+
+# Concurrent inspections. The shared TokenBucket still caps the request
+# rate, so this only hides round-trip latency: 32 in flight keeps the
+# 10 req/s quota busy even when an inspection takes ~3 s.
+MAX_WORKERS = 32
+MAX_RETRIES = 5
+RETRYABLE_STATUSES = (429, 500, 503)
 
 
 def mkdirp(path: str) -> None:
     os.makedirs(path, exist_ok=True)
 
 
-def safe_get(d: Dict, path: List[str], default=None):
-    cur = d
-    for key in path:
-        if not isinstance(cur, dict) or key not in cur:
-            return default
-        cur = cur[key]
-    return cur
-
-
 def read_urls(path: str) -> List[str]:
     if not os.path.exists(path):
         raise FileNotFoundError(f"URL list file not found: {path}")
 
-    urls: List[str] = []
+    # Text mode already normalises newlines, so split on "\n" only;
+    # dict.fromkeys de-dups while preserving order.
     with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            u = line.strip()
-            if not u or u.startswith("#"):
-                continue
-            urls.append(u)
+        lines = f.read().split("\n")
+    return list(
+        dict.fromkeys([u for u in map(str.strip, lines) if u and u[0] != "#"])
+    )
+
+
+def cache_key(site_url: str, body: Dict) -> str:
+    payload = json.dumps({"site": site_url, "body": body}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
 
-    # de-dup while preserving order
-    seen = set()
-    deduped = []
-    for u in urls:
-        if u not in seen:
-            seen.add(u)
-            deduped.append(u)
 
-    return deduped
+def cache_get(cache, key: str) -> Optional[Dict]:
+    hit = cache.get(key)
+    if hit is None:
+        return None
+    expires_at, value = hit
+    if expires_at is not None and expires_at <= time.time():
+        del cache[key]  # drop it so stale entries don't pile up across runs
+        return None
+    return value
 
 
-def get_service() -> object:
+def cache_set(cache, key: str, value: Dict, ttl: Optional[float]) -> None:
+    """
+    Stores value with an expiry; ttl=None keeps it forever.
+    """
+    cache[key] = (None if ttl is None else time.time() + ttl, value)
+
+
+def get_credentials() -> Credentials:
     if not os.path.exists(CLIENT_SECRET_FILE):
         raise FileNotFoundError(
             f"Missing {CLIENT_SECRET_FILE}. Download OAuth Desktop credentials JSON and rename it to {CLIENT_SECRET_FILE}."
@@ -92,34 +140,146 @@ def get_service() -> object:
         with open(TOKEN_FILE, "w", encoding="utf-8") as f:
             f.write(creds.to_json())
 
-    return build("searchconsole", "v1", credentials=creds)
+    return creds
+
+
+def get_service(creds: Credentials) -> object:
+    # Bundled discovery doc; already the default in 2.x, made explicit to pin it
+    return build("searchconsole", "v1", credentials=creds, static_discovery=True)
 
 
-def list_properties(service) -> List[Dict]:
-    resp = service.sites().list().execute()
-    return resp.get("siteEntry", []) or []
+def sites_cache_file(token_file: str) -> str:
+    """
+    One properties cache per token file, so switching accounts
+    never shows another account's properties.
+    """
+    digest = hashlib.sha256(os.path.abspath(token_file).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(os.path.expanduser("~"), f".gsc_sites_{digest}.json")
 
 
-def inspect_url(service, site_url: str, inspection_url: str, language_code: str = "en-US") -> Dict:
-    body = {
+def list_properties(service, token_file: str) -> List[Dict]:
+    """
+    Returns the account's GSC properties, reusing a cache file in ~
+    for up to an hour so warm runs skip the sites().list() call.
+    """
+    cache_file = sites_cache_file(token_file)
+    try:
+        cached_at = os.path.getmtime(cache_file)
+        # A token written after the cache (re-login) may belong to another account.
+        fresh = time.time() - cached_at < SITES_CACHE_TTL_SECONDS
+        if fresh and os.path.getmtime(token_file) <= cached_at:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    sites = service.sites().list().execute().get("siteEntry", []) or []
+    try:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(sites, f)
+    except OSError:
+        pass  # the cache is optional; e.g. ~ isn't writable
+    return sites
+
+
+def inspection_body(site_url: str, inspection_url: str, language_code: str) -> Dict:
+    return {
         "inspectionUrl": inspection_url,
         "siteUrl": site_url,
         "languageCode": language_code,
     }
-    # URL Inspection API endpoint
-    return service.urlInspection().index().inspect(body=body).execute()
+
+
+def inspect_url(
+    service, site_url: str, inspection_url: str, language_code: str = "en-US", http=None
+) -> Dict:
+    body = inspection_body(site_url, inspection_url, language_code)
+    # URL Inspection API endpoint; `http` overrides the service's transport (None = default)
+    return service.urlInspection().index().inspect(body=body, fields=RESPONSE_FIELDS).execute(http=http)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: bursts of up to `capacity` requests,
+    refilled at `rate` requests per second.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back every caller for `seconds` (e.g. a 429 Retry-After).
+        """
+        with self._lock:
+            self._refill()
+            self._tokens = min(self._tokens, -seconds * self.rate)
+
+
+def retry_after_seconds(e: HttpError) -> Optional[float]:
+    resp = getattr(e, "resp", None)
+    try:
+        return float(resp.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+def inspect_with_backoff(
+    service, http, limiter: TokenBucket, site_url: str, inspection_url: str, language_code: str
+) -> Dict:
+    """
+    inspect_url() with exponential backoff on rate limiting / transient errors.
+    A 429 with Retry-After pauses the shared limiter for every worker.
+    """
+    attempt = 0
+    while True:
+        limiter.acquire()
+        try:
+            return inspect_url(
+                service, site_url=site_url, inspection_url=inspection_url, language_code=language_code, http=http
+            )
+        except HttpError as e:
+            status = getattr(e, "status_code", None)
+            if status not in RETRYABLE_STATUSES or attempt >= MAX_RETRIES:
+                raise
+            retry_after = retry_after_seconds(e) if status == 429 else None
+            if retry_after is not None:
+                limiter.pause(retry_after)
+            else:
+                time.sleep(min(30, 2 ** attempt) + random.random())
+            attempt += 1
 
 
 def main():
     try:
-        service = get_service()
+        creds = get_credentials()
+        service = get_service(creds)
     except Exception as e:
         print(f"Setup error: {e}", file=sys.stderr)
         sys.exit(1)
 
     print("\nFetching your Search Console properties...")
     try:
-        sites = list_properties(service)
+        sites = list_properties(service, TOKEN_FILE)
     except HttpError as e:
         print(f"Could not list properties (HttpError): {e}", file=sys.stderr)
         sites = []
@@ -177,53 +337,65 @@ def main():
         "error",
     ]
 
-    # Gentle pacing to reduce 429s. Increase if you hit rate limits.
-    delay_seconds = 0.15
-
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for i, u in enumerate(urls, start=1):
-            row = {k: "" for k in fieldnames}
-            row["inspection_url"] = u
-            row["site_url"] = site_url
-
-            try:
-                resp = inspect_url(service, site_url=site_url, inspection_url=u, language_code=language_code)
-                index_result = safe_get(resp, ["inspectionResult", "indexStatusResult"], {}) or {}
-
-                row["verdict"] = index_result.get("verdict", "")
-                row["coverage_state"] = index_result.get("coverageState", "")
-                row["indexing_state"] = index_result.get("indexingState", "")
-                row["robots_txt_state"] = index_result.get("robotsTxtState", "")
-                row["page_fetch_state"] = index_result.get("pageFetchState", "")
-                row["crawled_as"] = index_result.get("crawledAs", "")
-                row["last_crawl_time"] = index_result.get("lastCrawlTime", "")
-                row["canonical_google"] = index_result.get("googleCanonical", "")
-                row["canonical_user"] = index_result.get("userCanonical", "")
-                refs = index_result.get("referringUrls") or []
-                row["referring_urls_count"] = str(len(refs))
-
-            except HttpError as e:
-                # Keep going but log the error in the CSV
-                status = getattr(e, "status_code", None)
-                row["error"] = f"HttpError: {e}"
-
-                # Basic backoff for transient errors / rate limiting
-                if status in (429, 500, 503):
-                    backoff = min(10, 1 + (i % 5) * 1.5)
-                    time.sleep(backoff)
-
-            except Exception as e:
-                row["error"] = f"Error: {e}"
-
-            writer.writerow(row)
-
-            if i % 25 == 0:
-                print(f"Processed {i}/{len(urls)}...")
-
-            time.sleep(delay_seconds)
+    limiter = TokenBucket(MAX_REQUESTS_PER_MINUTE / 60, BURST_REQUESTS)
+
+    # httplib2.Http is not thread-safe. Workers share the one service but each
+    # sends through its own authorized Http (build_http: client timeout + redirects),
+    # which keeps a keep-alive connection (DNS + TLS done once per worker, not per URL).
+    local = threading.local()
+    # shelve isn't thread-safe either; lookups are quick, so a single lock is enough.
+    cache_lock = threading.Lock()
+
+    # Rows are tuples in `fieldnames` order; failed URLs leave the result columns blank.
+    blank_result = ("",) * (len(fieldnames) - 3)
+
+    def inspect_row(u: str) -> Tuple[str, ...]:
+        try:
+            body = inspection_body(site_url, u, language_code)
+            # fields is part of the key: a different mask means a different response shape
+            key = cache_key(site_url, {**body, "fields": RESPONSE_FIELDS})
+            with cache_lock:
+                resp = cache_get(cache, key)
+
+            if resp is None:
+                if not hasattr(local, "http"):
+                    local.http = AuthorizedHttp(creds, http=build_http())
+                resp = inspect_with_backoff(service, local.http, limiter, site_url, u, language_code)
+                with cache_lock:
+                    cache_set(cache, key, resp, CACHE_TTL_SECONDS)
+
+            index_result = (resp.get("inspectionResult") or {}).get("indexStatusResult") or {}
+            refs = index_result.get("referringUrls") or []
+
+            return (
+                u,
+                site_url,
+                # index_result.get(key, "") for each key, in column order
+                *map(index_result.get, INDEX_STATUS_KEYS, repeat("")),
+                str(len(refs)),
+                "",
+            )
+
+        except HttpError as e:
+            # Keep going but log the error in the CSV
+            return (u, site_url, *blank_result, f"HttpError: {e}")
+
+        except Exception as e:
+            return (u, site_url, *blank_result, f"Error: {e}")
+
+    with shelve.open(CACHE_FILE) as cache, open(
+        out_csv, "w", newline="", encoding="utf-8", buffering=CSV_BUFFER_SIZE
+    ) as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
+
+        # map() yields in input order, so the CSV is written from this thread only.
+        with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            for i, row in enumerate(executor.map(inspect_row, urls), start=1):
+                writer.writerow(row)
+
+                if i % 25 == 0:
+                    print(f"Processed {i}/{len(urls)}...")
 
     print("\nDone.")
     print(f"CSV saved: {out_csv}\n")
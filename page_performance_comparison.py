@@ -12,30 +12,52 @@ Features
   - ctr + position (current + previous) (NO change calc for these)
 - Includes a guard for GSC's ~16-month Search Analytics data window:
   exits with a warning if current/previous period starts too far back.
+- Caches API responses in .gsc_cache (delete it to force a refresh)
 
 Auth files supported in either location:
 - project root: client_secret.json / token.json
 
 Install deps:
-  pip install google-api-python-client google-auth google-auth-oauthlib google-auth-httplib2
+  pip install "google-api-python-client>=2.0" google-auth google-auth-oauthlib google-auth-httplib2
+Optional (faster parsing of large API responses):
+  pip install orjson
 """
 
 from __future__ import annotations
 
 import calendar
 import csv
+import hashlib
+import json
 import os
+import shelve
+import time
 from datetime import date, datetime, timedelta
 from typing import Dict, List, Optional, Tuple
 
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from googleapiclient.model import JsonModel
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
 
+try:
+    import orjson
+except ImportError:  # optional: fall back to the client's stdlib json decoder
+    orjson = None
+
 
 SCOPES = ["https://www.googleapis.com/auth/webmasters.readonly"]
+ROW_LIMIT = 25000  # max rows per Search Analytics request
+# Partial response: only the columns we report, so large pages transfer less.
+RESPONSE_FIELDS = "rows(keys,clicks,impressions,ctr,position)"
+CSV_BUFFER_SIZE = 1 << 20  # write the CSV in 1 MiB blocks instead of 8 KiB
+
+CACHE_FILE = ".gsc_cache"
+CACHE_TTL_SECONDS = 24 * 60 * 60
+FINAL_DATA_LAG_DAYS = 3  # GSC data older than this no longer changes
+SITES_CACHE_TTL_SECONDS = 60 * 60
 
 
 # -----------------------------
@@ -58,6 +80,26 @@ def ensure_parent_dir(file_path: str) -> None:
         os.makedirs(parent, exist_ok=True)
 
 
+class OrjsonModel(JsonModel):
+    """
+    JsonModel that decodes responses with orjson, which is several times
+    faster than stdlib json on 25k-row Search Analytics pages.
+    """
+
+    def deserialize(self, content):
+        try:
+            return orjson.loads(content)
+        except orjson.JSONDecodeError:
+            return super().deserialize(content)
+
+
+def get_token_file() -> str:
+    # Prefer an existing token if present; otherwise default to root token.json
+    return first_existing_path(
+        ["token.json", os.path.join(".secrets", "token.json")]
+    ) or "token.json"
+
+
 def get_service():
     client_secret = first_existing_path(
         ["client_secret.json", os.path.join(".secrets", "client_secret.json")]
@@ -68,10 +110,7 @@ def get_service():
             "Download OAuth Desktop credentials and save as client_secret.json."
         )
 
-    # Prefer an existing token if present; otherwise default to root token.json
-    token_file = first_existing_path(
-        ["token.json", os.path.join(".secrets", "token.json")]
-    ) or "token.json"
+    token_file = get_token_file()
 
     creds: Optional[Credentials] = None
     if os.path.exists(token_file):
@@ -88,29 +127,56 @@ def get_service():
         with open(token_file, "w", encoding="utf-8") as f:
             f.write(creds.to_json())
 
-    return build("searchconsole", "v1", credentials=creds)
+    model = OrjsonModel() if orjson is not None else None
+    # Bundled discovery doc; already the default in 2.x, made explicit to pin it
+    return build("searchconsole", "v1", credentials=creds, model=model, static_discovery=True)
+
+
+def sites_cache_file(token_file: str) -> str:
+    """
+    One properties cache per token file, so switching accounts
+    never shows another account's properties.
+    """
+    digest = hashlib.sha256(os.path.abspath(token_file).encode("utf-8")).hexdigest()[:12]
+    return os.path.join(os.path.expanduser("~"), f".gsc_sites_{digest}.json")
+
+
+def list_properties(service, token_file: str) -> List[Dict]:
+    """
+    Returns the account's GSC properties, reusing a cache file in ~
+    for up to an hour so warm runs skip the sites().list() call.
+    """
+    cache_file = sites_cache_file(token_file)
+    try:
+        cached_at = os.path.getmtime(cache_file)
+        # A token written after the cache (re-login) may belong to another account.
+        fresh = time.time() - cached_at < SITES_CACHE_TTL_SECONDS
+        if fresh and os.path.getmtime(token_file) <= cached_at:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+    except (OSError, ValueError):
+        pass
+
+    sites = service.sites().list().execute().get("siteEntry", []) or []
+    try:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump(sites, f)
+    except OSError:
+        pass  # the cache is optional; e.g. ~ isn't writable
+    return sites
 
 
 def read_url_list(path: str) -> List[str]:
     if not os.path.exists(path):
         raise FileNotFoundError(f"URL list file not found: {path}")
 
-    urls: List[str] = []
+    # Text mode already normalises newlines, so split on "\n" only;
+    # dict.fromkeys de-dups while preserving order.
     with open(path, "r", encoding="utf-8") as f:
-        for line in f:
-            u = line.strip()
-            if not u or u.startswith("#"):
-                continue
-            urls.append(u)
-
-    # de-dup preserving order
-    seen = set()
-    out: List[str] = []
-    for u in urls:
-        if u not in seen:
-            seen.add(u)
-            out.append(u)
-    return out
+        lines = f.read().split("\n")
+    return list(
+        dict.fromkeys([u for u in map(str.strip, lines) if u and u[0] != "#"])
+    )
 
 
 # -----------------------------
@@ -184,50 +250,92 @@ def pct_change(current: float, previous: float) -> Optional[float]:
     return ((current - previous) / previous) * 100.0
 
 
+# -----------------------------
+# Response cache
+# -----------------------------
+def cache_key(site_url: str, body: Dict) -> str:
+    payload = json.dumps({"site": site_url, "body": body}, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cache_get(cache, key: str) -> Optional[Dict]:
+    hit = cache.get(key)
+    if hit is None:
+        return None
+    expires_at, value = hit
+    if expires_at is not None and expires_at <= time.time():
+        del cache[key]  # drop it so stale entries don't pile up across runs
+        return None
+    return value
+
+
+def cache_set(cache, key: str, value: Dict, ttl: Optional[float]) -> None:
+    """
+    Stores value with an expiry; ttl=None keeps it forever.
+    """
+    cache[key] = (None if ttl is None else time.time() + ttl, value)
+
+
+def cache_ttl(end_date: str) -> Optional[float]:
+    """
+    Periods that closed before GSC finalised its data never change
+    (typically the previous period), so their responses are cached forever.
+    """
+    final_before = date.today() - timedelta(days=FINAL_DATA_LAG_DAYS)
+    if parse_yyyy_mm_dd(end_date) < final_before:
+        return None
+    return CACHE_TTL_SECONDS
+
+
 # -----------------------------
 # GSC query
 # -----------------------------
-def fetch_page_metrics(
+NO_METRICS = {"clicks": 0.0, "impressions": 0.0, "ctr": 0.0, "position": 0.0}
+
+
+def fetch_all_page_metrics(
     service,
+    cache,
     site_url: str,
-    page_url: str,
     start_date: str,
     end_date: str,
-) -> Dict[str, float]:
+) -> Dict[str, Dict[str, float]]:
     """
-    Returns aggregated metrics for ONE page over a date range:
-    clicks, impressions, ctr, position.
+    Returns {page_url: metrics} for every page with data in the date range
+    (clicks, impressions, ctr, position), paging through the API 25k rows
+    at a time instead of issuing one filtered query per URL.
     """
+    ttl = cache_ttl(end_date)
+    metrics: Dict[str, Dict[str, float]] = {}
+    # Built once; only startRow changes between pages.
     body = {
         "startDate": start_date,
         "endDate": end_date,
         "dimensions": ["page"],
-        "dimensionFilterGroups": [
-            {
-                "filters": [
-                    {
-                        "dimension": "page",
-                        "operator": "equals",
-                        "expression": page_url,
-                    }
-                ]
-            }
-        ],
-        "rowLimit": 1,
-    }
-
-    resp = service.searchanalytics().query(siteUrl=site_url, body=body).execute()
-    rows = resp.get("rows", []) or []
-    if not rows:
-        return {"clicks": 0.0, "impressions": 0.0, "ctr": 0.0, "position": 0.0}
-
-    r = rows[0]
-    return {
-        "clicks": float(r.get("clicks", 0.0)),
-        "impressions": float(r.get("impressions", 0.0)),
-        "ctr": float(r.get("ctr", 0.0)),
-        "position": float(r.get("position", 0.0)),
+        "rowLimit": ROW_LIMIT,
+        "startRow": 0,
     }
+    while True:
+        # fields is part of the key: a different mask means a different response shape
+        key = cache_key(site_url, {**body, "fields": RESPONSE_FIELDS})
+        resp = cache_get(cache, key)
+        if resp is None:
+            resp = service.searchanalytics().query(
+                siteUrl=site_url, body=body, fields=RESPONSE_FIELDS
+            ).execute()
+            cache_set(cache, key, resp, ttl)
+
+        rows = resp.get("rows", []) or []
+        for r in rows:
+            metrics[r["keys"][0]] = {
+                "clicks": float(r.get("clicks", 0.0)),
+                "impressions": float(r.get("impressions", 0.0)),
+                "ctr": float(r.get("ctr", 0.0)),
+                "position": float(r.get("position", 0.0)),
+            }
+        if len(rows) < ROW_LIMIT:
+            return metrics
+        body["startRow"] += ROW_LIMIT
 
 
 # -----------------------------
@@ -238,7 +346,7 @@ def main():
 
     # List properties to help selection
     try:
-        sites = service.sites().list().execute().get("siteEntry", []) or []
+        sites = list_properties(service, get_token_file())
     except HttpError as e:
         print(f"Could not list properties (HttpError): {e}")
         sites = []
@@ -302,76 +410,63 @@ def main():
     print(f"\nComparing {len(urls)} URLs…")
     print(f"Saving results to: {out_csv}\n")
 
-    with open(out_csv, "w", newline="", encoding="utf-8") as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-
-        for i, page_url in enumerate(urls, start=1):
-            try:
-                cur = fetch_page_metrics(service, site_url, page_url, cur_start_s, cur_end_s)
-                prev = fetch_page_metrics(service, site_url, page_url, prev_start_s, prev_end_s)
-
-                clicks_cur = cur["clicks"]
-                clicks_prev = prev["clicks"]
-                impr_cur = cur["impressions"]
-                impr_prev = prev["impressions"]
-
-                clicks_abs = clicks_cur - clicks_prev
-                impr_abs = impr_cur - impr_prev
-
-                clicks_pct = pct_change(clicks_cur, clicks_prev)
-                impr_pct = pct_change(impr_cur, impr_prev)
-
-                writer.writerow(
-                    {
-                        "page_url": page_url,
-                        "site_url": site_url,
-                        "current_start": cur_start_s,
-                        "current_end": cur_end_s,
-                        "previous_start": prev_start_s,
-                        "previous_end": prev_end_s,
-                        "clicks_current": int(round(clicks_cur)),
-                        "clicks_previous": int(round(clicks_prev)),
-                        "clicks_change_abs": int(round(clicks_abs)),
-                        "clicks_change_pct": "" if clicks_pct is None else round(clicks_pct, 2),
-                        "impressions_current": int(round(impr_cur)),
-                        "impressions_previous": int(round(impr_prev)),
-                        "impressions_change_abs": int(round(impr_abs)),
-                        "impressions_change_pct": "" if impr_pct is None else round(impr_pct, 2),
-                        "ctr_current": round(cur["ctr"], 6),
-                        "ctr_previous": round(prev["ctr"], 6),
-                        "position_current": round(cur["position"], 2),
-                        "position_previous": round(prev["position"], 2),
-                    }
-                )
+    with open(out_csv, "w", newline="", encoding="utf-8", buffering=CSV_BUFFER_SIZE) as f:
+        writer = csv.writer(f)
+        writer.writerow(fieldnames)
 
-            except HttpError as e:
-                print(f"HttpError for {page_url}: {e}")
-                writer.writerow(
-                    {
-                        "page_url": page_url,
-                        "site_url": site_url,
-                        "current_start": cur_start_s,
-                        "current_end": cur_end_s,
-                        "previous_start": prev_start_s,
-                        "previous_end": prev_end_s,
-                        "clicks_current": "",
-                        "clicks_previous": "",
-                        "clicks_change_abs": "",
-                        "clicks_change_pct": "",
-                        "impressions_current": "",
-                        "impressions_previous": "",
-                        "impressions_change_abs": "",
-                        "impressions_change_pct": "",
-                        "ctr_current": "",
-                        "ctr_previous": "",
-                        "position_current": "",
-                        "position_previous": "",
-                    }
+        try:
+            with shelve.open(CACHE_FILE) as cache:
+                cur_metrics: Optional[Dict[str, Dict[str, float]]] = fetch_all_page_metrics(
+                    service, cache, site_url, cur_start_s, cur_end_s
+                )
+                prev_metrics = fetch_all_page_metrics(
+                    service, cache, site_url, prev_start_s, prev_end_s
                 )
+        except HttpError as e:
+            print(f"HttpError fetching page metrics: {e}")
+            cur_metrics = prev_metrics = None
+
+        # Rows are tuples in `fieldnames` order.
+        row_prefix = (site_url, cur_start_s, cur_end_s, prev_start_s, prev_end_s)
+        blank_metrics = ("",) * (len(fieldnames) - 1 - len(row_prefix))
 
-            if i % 25 == 0:
-                print(f"Processed {i}/{len(urls)}…")
+        for page_url in urls:
+            if cur_metrics is None or prev_metrics is None:
+                writer.writerow((page_url, *row_prefix, *blank_metrics))
+                continue
+
+            cur = cur_metrics.get(page_url, NO_METRICS)
+            prev = prev_metrics.get(page_url, NO_METRICS)
+
+            clicks_cur = cur["clicks"]
+            clicks_prev = prev["clicks"]
+            impr_cur = cur["impressions"]
+            impr_prev = prev["impressions"]
+
+            clicks_abs = clicks_cur - clicks_prev
+            impr_abs = impr_cur - impr_prev
+
+            clicks_pct = pct_change(clicks_cur, clicks_prev)
+            impr_pct = pct_change(impr_cur, impr_prev)
+
+            writer.writerow(
+                (
+                    page_url,
+                    *row_prefix,
+                    f"{clicks_cur:.0f}",
+                    f"{clicks_prev:.0f}",
+                    f"{clicks_abs:.0f}",
+                    "" if clicks_pct is None else f"{clicks_pct:.2f}",
+                    f"{impr_cur:.0f}",
+                    f"{impr_prev:.0f}",
+                    f"{impr_abs:.0f}",
+                    "" if impr_pct is None else f"{impr_pct:.2f}",
+                    f"{cur['ctr']:.6f}",
+                    f"{prev['ctr']:.6f}",
+                    f"{cur['position']:.2f}",
+                    f"{prev['position']:.2f}",
+                )
+            )
 
     print("\nDone.")
 